@@ -1,23 +1,32 @@
-import smtplib
+import asyncio
+import logging
+import re
+import time
+import aiosmtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
-import json
 import httpx
-from datetime import datetime
+import orjson
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
 from typing import Optional
-from fastapi import FastAPI, HTTPException
+from fastapi import BackgroundTasks, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from dotenv import load_dotenv
+import jinja2
 import openai
+import redis.asyncio as redis
+
+logging.basicConfig(level=os.getenv("LOGLEVEL", "INFO"))
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 try:
     load_dotenv()
 except Exception as e:
-    print(f"Warning: Could not load .env file: {e}")
-    print("Using environment variables or defaults...")
+    logger.warning(f"Could not load .env file: {e}; using environment variables or defaults")
 
 # Email configuration
 SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
@@ -33,24 +42,28 @@ supabase_key = os.getenv("SUPABASE_KEY")
 relay_webhook_url = os.getenv("RELAY_WEBHOOK_URL", "https://httpbin.org/post")  # Changed to demo URL since we're using direct email
 
 if not openai_api_key:
-    print("Warning: No OpenAI API key found, using demo mode")
+    logger.warning("No OpenAI API key found, using demo mode")
+    openai_client = None
 else:
-    openai.api_key = openai_api_key
+    # Async client shares one keep-alive HTTP pool across requests
+    openai_client = openai.AsyncOpenAI(api_key=openai_api_key, max_retries=2, timeout=10)
 
 app = FastAPI(title="Welfare Scheme Assistant", version="1.0.0")
 
 # CORS middleware
+# Closed origin set keeps Starlette on the fast exact-match path (the "*"
+# wildcard branch rewrites headers per request and is invalid alongside
+# allow_credentials anyway)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
         "http://localhost:5173",  # Vite dev server
         "http://localhost:3000",  # Alternative dev port
         "http://localhost:4173",  # Vite preview server
-        "*"  # Allow all origins for production
     ],
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["POST", "GET", "OPTIONS"],
+    allow_headers=["content-type"],
 )
 
 # Pydantic models
@@ -61,8 +74,11 @@ class ChatRequest(BaseModel):
 class ChatResponse(BaseModel):
     reply: str
 
-# Session state model
-class UserSession(BaseModel):
+# Session state record - a slotted dataclass rather than a Pydantic model
+# since it's internal mutable state, never validated from external input;
+# instances are lighter and attribute access skips descriptor overhead
+@dataclass(slots=True)
+class UserSession:
     session_id: str
     name: Optional[str] = None
     age: Optional[int] = None
@@ -72,37 +88,133 @@ class UserSession(BaseModel):
     email: Optional[str] = None
     eligible_schemes: Optional[list] = None
     current_field: str = "name"  # Track which field we're collecting
-    conversation_history: list = []
 
-# In-memory session storage (in production, use Redis or database)
-sessions = {}
+    def to_json(self) -> bytes:
+        return orjson.dumps(asdict(self))
 
-def send_eligibility_email(user_data):
-    """Send eligibility email directly using SMTP"""
-    try:
-        # Create message with proper headers to avoid "Show quoted text"
-        msg = MIMEMultipart('alternative')
-        msg['From'] = FROM_EMAIL
-        msg['To'] = user_data['email']
-        msg['Subject'] = "Your Government Welfare Scheme Eligibility Results"
-        msg['X-Mailer'] = 'Government Welfare Assistant'
-        msg['Reply-To'] = FROM_EMAIL
+    @classmethod
+    def from_json(cls, raw) -> "UserSession":
+        return cls(**orjson.loads(raw))
 
-        # Email body - clean, simple text without extra whitespace
-        schemes_text = "\n".join(f"• {scheme}" for scheme in user_data['eligible_schemes'])
+# Session storage - Redis when REDIS_URL is set (survives restarts, scales
+# across workers, TTL cleans up abandoned sessions), in-memory dict otherwise
+redis_url = os.getenv("REDIS_URL")
+if redis_url:
+    redis_client = redis.Redis.from_url(redis_url)
+else:
+    logger.warning("No REDIS_URL found, using in-memory session storage")
+    redis_client = None
+
+SESSION_TTL = 3600  # seconds before an abandoned session expires
+sessions = {}  # fallback storage when Redis is not configured
+
+class SMTPPool:
+    """Persistent async SMTP connection reused across sends.
+
+    Connecting, STARTTLS and AUTH dominate the cost of sending a single
+    email, so we do them once and keep the connection alive. aiosmtplib
+    uses asyncio sockets, so the multi-round-trip SMTP dialog never blocks
+    the event loop; the asyncio.Lock serializes sends because SMTP is
+    sequential per connection. The connection is recycled after MAX_AGE
+    seconds or MAX_MESSAGES sends, and rebuilt transparently if the
+    server drops it.
+    """
 
-        text_body = f"""Dear {user_data['name']},
+    MAX_AGE = 300  # seconds before forcing a fresh connection
+    MAX_MESSAGES = 100  # sends before forcing a fresh connection
+
+    def __init__(self, server, port, username, password):
+        self.server = server
+        self.port = port
+        self.username = username
+        self.password = password
+        self._lock = asyncio.Lock()
+        self._conn = None
+        self._connected_at = 0.0
+        self._sent_count = 0
+
+    async def _connect(self):
+        conn = aiosmtplib.SMTP(
+            hostname=self.server,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+            start_tls=True
+        )
+        await conn.connect()
+        self._conn = conn
+        self._connected_at = time.monotonic()
+        self._sent_count = 0
+
+    async def _ensure_connection(self):
+        if self._conn is not None:
+            expired = (
+                time.monotonic() - self._connected_at > self.MAX_AGE
+                or self._sent_count >= self.MAX_MESSAGES
+            )
+            if not expired:
+                try:
+                    await self._conn.noop()
+                    return
+                except aiosmtplib.SMTPException:
+                    pass
+            await self._close()
+        await self._connect()
+
+    async def _close(self):
+        if self._conn is not None:
+            try:
+                await self._conn.quit()
+            except Exception:
+                pass
+            self._conn = None
+
+    async def send(self, from_addr, to_addr, msg):
+        """Send a message, reconnecting and retrying once on a dead connection"""
+        async with self._lock:
+            await self._ensure_connection()
+            try:
+                await self._conn.sendmail(from_addr, to_addr, msg.as_string())
+            except (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPException):
+                await self._close()
+                await self._connect()
+                await self._conn.sendmail(from_addr, to_addr, msg.as_string())
+            self._sent_count += 1
+
+    async def close(self):
+        async with self._lock:
+            await self._close()
+
+smtp_pool = SMTPPool(SMTP_SERVER, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD)
+
+# Shared HTTP client for Supabase - keeps connections alive across saves
+supabase_client = httpx.AsyncClient(
+    base_url=supabase_url or "https://demo.supabase.co",
+    headers={
+        "apikey": supabase_key or "",
+        "Authorization": f"Bearer {supabase_key}",
+        "Content-Type": "application/json"
+    },
+    limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+    timeout=5.0
+)
+
+# Email body templates - compiled once at import, rendered per send.
+# Autoescape on the HTML template prevents user-supplied fields (name,
+# state, scheme names) from injecting markup.
+_TEXT_BODY_TEMPLATE = jinja2.Template("""Dear {{ name }},
 
 Thank you for using our Government Welfare Scheme Assistant!
 
 Based on your information:
-- Age: {user_data['age']} years
-- Annual Income: ₹{user_data['income']}
-- State: {user_data['state']}
-- Phone: {user_data['phone']}
+- Age: {{ age }} years
+- Annual Income: ₹{{ income }}
+- State: {{ state }}
+- Phone: {{ phone }}
 
 You may be eligible for the following government welfare schemes:
-{schemes_text}
+{% for scheme in eligible_schemes %}• {{ scheme }}
+{% endfor %}
 
 Please visit your nearest government office or the respective scheme website for detailed information and application procedures.
 
@@ -112,34 +224,28 @@ For more information about specific schemes, you can:
 3. Use our chat assistant for more details
 
 Best regards,
-Government Welfare Scheme Assistant"""
+Government Welfare Scheme Assistant""", autoescape=False)
 
-        # Create HTML version to ensure proper formatting
-        html_body = f"""<html>
+_HTML_BODY_TEMPLATE = jinja2.Template("""<html>
 <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
 <h2 style="color: #2c5aa0;">Your Government Welfare Scheme Eligibility Results</h2>
 
-<p>Dear <strong>{user_data['name']}</strong>,</p>
+<p>Dear <strong>{{ name }}</strong>,</p>
 
 <p>Thank you for using our Government Welfare Scheme Assistant!</p>
 
 <h3>Your Information:</h3>
 <ul>
-<li><strong>Age:</strong> {user_data['age']} years</li>
-<li><strong>Annual Income:</strong> ₹{user_data['income']}</li>
-<li><strong>State:</strong> {user_data['state']}</li>
-<li><strong>Phone:</strong> {user_data['phone']}</li>
+<li><strong>Age:</strong> {{ age }} years</li>
+<li><strong>Annual Income:</strong> ₹{{ income }}</li>
+<li><strong>State:</strong> {{ state }}</li>
+<li><strong>Phone:</strong> {{ phone }}</li>
 </ul>
 
 <h3>You may be eligible for the following government welfare schemes:</h3>
 <ul>
-"""
-
-        for scheme in user_data['eligible_schemes']:
-            html_body += f"<li>{scheme}</li>"
-
-        html_body += """
-</ul>
+{% for scheme in eligible_schemes %}<li>{{ scheme }}</li>
+{% endfor %}</ul>
 
 <p>Please visit your nearest government office or the respective scheme website for detailed information and application procedures.</p>
 
@@ -153,32 +259,51 @@ Government Welfare Scheme Assistant"""
 <p>Best regards,<br>
 <strong>Government Welfare Scheme Assistant</strong></p>
 </body>
-</html>"""
+</html>""", autoescape=True)
+
+async def send_eligibility_email(user_data):
+    """Send eligibility email directly using SMTP"""
+    try:
+        # Create message with proper headers to avoid "Show quoted text"
+        msg = MIMEMultipart('alternative')
+        msg['From'] = FROM_EMAIL
+        msg['To'] = user_data['email']
+        msg['Subject'] = "Your Government Welfare Scheme Eligibility Results"
+        msg['X-Mailer'] = 'Government Welfare Assistant'
+        msg['Reply-To'] = FROM_EMAIL
+
+        text_body = _TEXT_BODY_TEMPLATE.render(**user_data)
+        html_body = _HTML_BODY_TEMPLATE.render(**user_data)
 
         # Attach both plain text and HTML versions
         msg.attach(MIMEText(text_body, 'plain'))
         msg.attach(MIMEText(html_body, 'html'))
 
-        # Send email
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(SMTP_USERNAME, SMTP_PASSWORD)
-        text = msg.as_string()
-        server.sendmail(FROM_EMAIL, user_data['email'], text)
-        server.quit()
+        # Send email over the pooled connection
+        await smtp_pool.send(FROM_EMAIL, user_data['email'], msg)
 
-        print(f"[SUCCESS] Email sent to {user_data['email']}")
+        logger.info(f"Email sent to {user_data['email']}")
         return True
 
     except Exception as e:
-        print(f"[FAILED] Email sending failed: {e}")
+        logger.error(f"Email sending failed: {e}")
         return False
 
 # Helper functions
-def get_session(session_id: str) -> UserSession:
-    if session_id not in sessions:
-        sessions[session_id] = UserSession(session_id=session_id)
-    return sessions[session_id]
+async def get_session(session_id: str) -> UserSession:
+    if redis_client is None:
+        if session_id not in sessions:
+            sessions[session_id] = UserSession(session_id=session_id)
+        return sessions[session_id]
+    raw = await redis_client.get(f"sess:{session_id}")
+    if raw:
+        return UserSession.from_json(raw)
+    return UserSession(session_id=session_id)
+
+async def save_session(session: UserSession):
+    if redis_client is None:
+        return
+    await redis_client.set(f"sess:{session.session_id}", session.to_json(), ex=SESSION_TTL)
 
 def validate_age(age_str: str) -> Optional[int]:
     try:
@@ -189,19 +314,25 @@ def validate_age(age_str: str) -> Optional[int]:
         pass
     return None
 
+_INCOME_STRIP_TABLE = str.maketrans('', '', ',₹$ \t')
+
 def validate_income(income_str: str) -> Optional[float]:
     try:
-        income = float(income_str.replace(',', '').replace('₹', '').replace('$', ''))
+        income = float(income_str.translate(_INCOME_STRIP_TABLE))
         if income >= 0:
             return income
     except ValueError:
         pass
     return None
 
+# Precompiled validation patterns and strip tables
+_PHONE_RE = re.compile(r'^\d{10}$')
+_EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+_PHONE_STRIP_TABLE = str.maketrans('', '', ' -()')
+
 def validate_phone(phone_str: str) -> Optional[str]:
     """Validate phone number (10 digits, with optional country code)"""
-    import re
-    phone_str = phone_str.strip().replace(' ', '').replace('-', '').replace('(', '').replace(')', '')
+    phone_str = phone_str.strip().translate(_PHONE_STRIP_TABLE)
 
     # Remove country code if present (+91, 91, etc.)
     if phone_str.startswith('+91'):
@@ -210,33 +341,28 @@ def validate_phone(phone_str: str) -> Optional[str]:
         phone_str = phone_str[2:]
 
     # Check if it's exactly 10 digits
-    if re.match(r'^\d{10}$', phone_str):
+    if _PHONE_RE.match(phone_str):
         return phone_str
     return None
 
 def validate_email(email_str: str) -> Optional[str]:
     """Validate email address"""
-    import re
     email_str = email_str.strip().lower()
 
-    # Basic email regex pattern
-    email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-
-    if re.match(email_pattern, email_str):
+    if _EMAIL_RE.match(email_str):
         return email_str
     return None
 
-def evaluate_eligibility(session: UserSession) -> dict:
-    """Use OpenAI to evaluate eligibility based on user profile"""
-    prompt = f"""
-    Based on the following user profile, determine eligibility for Indian government welfare schemes:
+# Cache of eligibility results keyed by coarse demographic buckets.
+# Users in the same (age, income, state) bracket get identical results,
+# so most sessions skip the OpenAI call entirely.
+_eligibility_cache = {}
+_ELIGIBILITY_CACHE_MAX = 4096
 
-    Name: {session.name}
-    Age: {session.age}
-    Annual Income: ₹{session.income}
-    State: {session.state}
+def _eligibility_cache_key(session: UserSession) -> tuple:
+    return (session.age // 5, round(session.income / 50000), session.state.lower().strip())
 
-    Consider major Indian government welfare schemes like:
+_SCHEMES_PROMPT = """Consider major Indian government welfare schemes like:
     - Ayushman Bharat ( Pradhan Mantri Jan Arogya Yojana) - Health insurance for low-income families
     - PM Awas Yojana - Housing scheme for low-income families
     - MGNREGA - Rural employment guarantee
@@ -247,50 +373,150 @@ def evaluate_eligibility(session: UserSession) -> dict:
     - Sukanya Samriddhi Yojana - Girl child savings scheme
     - Atal Pension Yojana - Pension scheme for unorganized sector
 
-    Also consider state-specific schemes based on the state: {session.state}
+    Also consider state-specific schemes based on each user's state."""
 
-    Return a JSON response with:
-    {{
-        "eligible_schemes": ["scheme_name_1", "scheme_name_2", ...],
-        "reasoning": "brief explanation of eligibility"
-    }}
+class EligibilityBatcher:
+    """Coalesces concurrent eligibility evaluations into one OpenAI call.
 
-    Focus on schemes where the user likely qualifies based on age, income, and location.
+    When several users finish onboarding within a short window, their
+    profiles are sent as one batched prompt returning a JSON array, so
+    the fixed per-call overhead (RTT, TLS, scheduling) is paid once
+    instead of once per user.
     """
 
-    try:
-        response = openai.chat.completions.create(
+    MAX_BATCH = 16
+    MAX_WAIT = 0.05  # seconds to wait for more profiles after the first
+    IDLE_TIMEOUT = 30  # seconds before the idle worker task exits
+
+    def __init__(self):
+        self._queue = asyncio.Queue()
+        self._worker = None
+
+    async def evaluate(self, session: UserSession) -> dict:
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((session, future))
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        return await future
+
+    async def _run(self):
+        while True:
+            try:
+                batch = [await asyncio.wait_for(self._queue.get(), timeout=self.IDLE_TIMEOUT)]
+            except asyncio.TimeoutError:
+                return  # idle; restarted lazily on the next evaluate()
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.MAX_WAIT
+            while len(batch) < self.MAX_BATCH:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                results = await self._evaluate_batch([session for session, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    async def _evaluate_batch(self, batch_sessions: list) -> list:
+        if openai_client is None:
+            raise RuntimeError("OpenAI client not configured")
+
+        profiles = "\n".join(
+            f"    {i + 1}. Age: {s.age}, Annual Income: ₹{s.income}, State: {s.state}"
+            for i, s in enumerate(batch_sessions)
+        )
+        prompt = f"""
+    Based on the following user profiles, determine each user's eligibility for Indian government welfare schemes:
+
+{profiles}
+
+    {_SCHEMES_PROMPT}
+
+    Return a JSON array with one object per profile, in the same order:
+    [
+        {{
+            "eligible_schemes": ["scheme_name_1", "scheme_name_2", ...],
+            "reasoning": "brief explanation of eligibility"
+        }},
+        ...
+    ]
+
+    Focus on schemes where each user likely qualifies based on age, income, and location.
+    """
+
+        response = await openai_client.chat.completions.create(
             model="gpt-3.5-turbo",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.1,
-            max_tokens=500
+            max_tokens=500 * len(batch_sessions)
         )
         content = response.choices[0].message.content
 
-        # Extract JSON from response
-        start_idx = content.find('{')
-        end_idx = content.rfind('}') + 1
-        if start_idx != -1 and end_idx > start_idx:
-            json_str = content[start_idx:end_idx]
-            result = json.loads(json_str)
-            return result
-        else:
-            return {"eligible_schemes": [], "reasoning": "Unable to determine eligibility"}
+        # Extract the JSON array from the response
+        start_idx = content.find('[')
+        end_idx = content.rfind(']') + 1
+        if start_idx == -1 or end_idx <= start_idx:
+            raise ValueError("No JSON array in model response")
+        results = orjson.loads(content[start_idx:end_idx])
+        if not isinstance(results, list) or len(results) != len(batch_sessions):
+            raise ValueError(f"Expected {len(batch_sessions)} results, got {len(results)}")
+        return results
+
+eligibility_batcher = EligibilityBatcher()
+
+# Declarative fallback rules used when the OpenAI call fails: one row per
+# scheme as (name, age_min, age_max, income_max). income_max of None means
+# no income cap; adding a scheme is adding a row, not another branch.
+_FALLBACK_SCHEMES = (
+    ("Ayushman Bharat", 0, 59, 500000),
+    ("PM Awas Yojana", 0, 59, 500000),
+    ("Atal Pension Yojana", 60, 120, None),
+    ("PM Kisan", 60, 120, None),
+)
+
+def _fallback_schemes(age, income) -> list:
+    if not age:
+        return []
+    return [
+        name
+        for name, age_min, age_max, income_max in _FALLBACK_SCHEMES
+        if age_min <= age <= age_max
+        and (income_max is None or (income and income < income_max))
+    ]
+
+async def evaluate_eligibility(session: UserSession) -> dict:
+    """Use OpenAI to evaluate eligibility based on user profile"""
+    cache_key = _eligibility_cache_key(session)
+    cached = _eligibility_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    try:
+        result = await eligibility_batcher.evaluate(session)
+        # Only successful OpenAI results are cached; fallbacks from
+        # transient API failures should not stick around
+        if len(_eligibility_cache) >= _ELIGIBILITY_CACHE_MAX:
+            _eligibility_cache.pop(next(iter(_eligibility_cache)))
+        _eligibility_cache[cache_key] = result
+        return result
     except Exception as e:
-        print(f"Error evaluating eligibility: {e}")
+        logger.error(f"Error evaluating eligibility: {e}")
         # Fallback: simulate eligibility based on basic criteria
-        eligible_schemes = []
-        if session.age and session.age < 60 and session.income and session.income < 500000:
-            eligible_schemes = ["Ayushman Bharat", "PM Awas Yojana"]
-        elif session.age and session.age >= 60:
-            eligible_schemes = ["Atal Pension Yojana", "PM Kisan"]
-
         return {
-            "eligible_schemes": eligible_schemes,
+            "eligible_schemes": _fallback_schemes(session.age, session.income),
             "reasoning": "Eligibility determined using fallback logic due to API issues"
         }
 
-def save_to_supabase(session: UserSession):
+async def save_to_supabase(session: UserSession):
     """Save user eligibility data to Supabase"""
     try:
         data = {
@@ -302,40 +528,30 @@ def save_to_supabase(session: UserSession):
             "phone": session.phone,
             "email": session.email,
             "eligible_schemes": session.eligible_schemes or [],
-            "created_at": datetime.utcnow().isoformat()
+            "created_at": datetime.now(timezone.utc).isoformat(timespec='seconds')
         }
 
-        print("=== SUPABASE SAVE OPERATION ===")
-        print("Saving the following record to database:")
-        print(json.dumps(data, indent=2))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Saving record to database:\n%s",
+                         orjson.dumps(data, option=orjson.OPT_INDENT_2).decode())
 
         # Try to save to real Supabase if credentials are available and not demo
         if supabase_url and supabase_key and supabase_url != "https://demo.supabase.co":
             try:
-                headers = {
-                    "apikey": supabase_key,
-                    "Authorization": f"Bearer {supabase_key}",
-                    "Content-Type": "application/json"
-                }
-                import requests as req
-                response = req.post(
-                    f"{supabase_url}/rest/v1/user_eligibility",
-                    json=data,
-                    headers=headers
-                )
-                print(f"[SUCCESS] Real Supabase save: {response.status_code}")
+                # content= with pre-encoded bytes skips httpx's own json re-encode;
+                # the shared client already sends Content-Type: application/json
+                response = await supabase_client.post("/rest/v1/user_eligibility", content=orjson.dumps(data))
+                logger.info(f"Supabase save: {response.status_code}")
             except Exception as real_error:
-                print(f"[FAILED] Real Supabase save failed: {real_error}")
+                logger.error(f"Supabase save failed: {real_error}")
         else:
-            print("[DEMO] Data logged (set real SUPABASE_URL/SUPABASE_KEY for actual saving)")
-        print("=================================")
+            logger.debug("Demo mode: data logged only (set real SUPABASE_URL/SUPABASE_KEY for actual saving)")
 
     except Exception as e:
-        print(f"Error in database save: {e}")
+        logger.error(f"Error in database save: {e}")
 
-def trigger_webhook(session: UserSession):
+async def trigger_webhook(session: UserSession):
     """Send eligibility email to user"""
-    print("DEBUG: trigger_webhook function called")
     try:
         user_data = {
             "name": session.name,
@@ -347,122 +563,132 @@ def trigger_webhook(session: UserSession):
             "eligible_schemes": session.eligible_schemes or []
         }
 
-        print("=== EMAIL NOTIFICATION ===")
-        print("Sending eligibility email to user:")
-        print(f"Name: {user_data['name']}")
-        print(f"Email: {user_data['email']}")
-        print(f"Eligible Schemes: {len(user_data['eligible_schemes'])} schemes")
+        logger.debug("Sending eligibility email to %s (%s), %d schemes",
+                     user_data['name'], user_data['email'], len(user_data['eligible_schemes']))
 
         # Send email directly
-        if send_eligibility_email(user_data):
-            print("[SUCCESS] Eligibility email sent successfully")
-        else:
-            print("[FAILED] Email sending failed - check SMTP configuration")
-
-        print("===================================")
+        if not await send_eligibility_email(user_data):
+            logger.error("Email sending failed - check SMTP configuration")
 
     except Exception as e:
-        print(f"Error in email notification: {e}")
-
-def process_message(session: UserSession, user_message: str) -> str:
-    """Process user message and return response"""
-    user_message = user_message.lower().strip()
-
-    # Add user message to conversation history
-    session.conversation_history.append({"role": "user", "message": user_message})
-
-    # Determine which field to collect next
-    if not session.name:
-        # Extract name from message
-        if len(user_message.split()) >= 1 and user_message not in ['hi', 'hello', 'hey', 'start']:
-            session.name = user_message.title()
-            session.current_field = "age"
-            response = "What is your age?"
-        else:
-            response = "Hello! I'm here to help you find government welfare schemes you may be eligible for. What is your name?"
-
-    elif not session.age:
-        age = validate_age(user_message)
-        if age:
-            session.age = age
-            session.current_field = "income"
-            response = "What is your annual income (in rupees)?"
-        else:
-            response = "Please provide a valid age (numbers only, between 1-120)."
-
-    elif not session.income:
-        income = validate_income(user_message)
-        if income:
-            session.income = income
-            session.current_field = "state"
-            response = "Which state do you live in?"
-        else:
-            response = "Please provide a valid annual income (numbers only, e.g., 120000)."
-
-    elif not session.state:
-        if len(user_message) > 2:  # Basic validation
-            session.state = user_message.title()
-            session.current_field = "phone"
-            response = "What is your phone number?"
-        else:
-            response = "Please provide a valid state name."
-
-    elif not session.phone:
-        phone = validate_phone(user_message)
-        if phone:
-            session.phone = phone
-            session.current_field = "email"
-            response = "What is your email address?"
-        else:
-            response = "Please provide a valid phone number (10 digits, e.g., 9876543210)."
-
-    elif not session.email:
-        email = validate_email(user_message)
-        if email:
-            session.email = email
-            session.current_field = "complete"
-
-            # All data collected, evaluate eligibility
-            result = evaluate_eligibility(session)
-            session.eligible_schemes = result.get("eligible_schemes", [])
+        logger.error(f"Error in email notification: {e}")
 
-            schemes_text = "\n".join(f"• {scheme}" for scheme in session.eligible_schemes) if session.eligible_schemes else "No specific schemes identified"
+async def finalize_session(session: UserSession):
+    """Evaluate eligibility, save the record and email the results.
 
-            response = f"Based on your details, you may be eligible for:\n{schemes_text}\n\nYou will receive a detailed email with your eligibility results."
-
-            # Save to database and send email
-            save_to_supabase(session)
-            trigger_webhook(session)
-        else:
-            response = "Please provide a valid email address (e.g., user@example.com)."
-
-    else:
-        # Handle follow-up questions
-        if "tell me more" in user_message or "more about" in user_message:
-            response = "I can provide more details about specific schemes. Please mention which scheme you'd like to know more about."
-        else:
-            response = "I've already assessed your eligibility. Check your email for detailed results, or start over with different information?"
-
-    # Add response to conversation history
-    session.conversation_history.append({"role": "assistant", "message": response})
-
-    return response
+    Runs as a background task so the user gets their chat reply without
+    waiting on OpenAI, Supabase or SMTP.
+    """
+    result = await evaluate_eligibility(session)
+    session.eligible_schemes = result.get("eligible_schemes", [])
+    await save_session(session)
+    await save_to_supabase(session)
+    await trigger_webhook(session)
+
+_GREETINGS = frozenset({'hi', 'hello', 'hey', 'start'})
+
+def _handle_name(session: UserSession, user_message: str) -> tuple:
+    if len(user_message.split()) >= 1 and user_message.lower() not in _GREETINGS:
+        session.name = user_message.title()
+        session.current_field = "age"
+        return "What is your age?", None
+    return "Hello! I'm here to help you find government welfare schemes you may be eligible for. What is your name?", None
+
+def _handle_age(session: UserSession, user_message: str) -> tuple:
+    age = validate_age(user_message)
+    if age:
+        session.age = age
+        session.current_field = "income"
+        return "What is your annual income (in rupees)?", None
+    return "Please provide a valid age (numbers only, between 1-120).", None
+
+def _handle_income(session: UserSession, user_message: str) -> tuple:
+    income = validate_income(user_message)
+    if income:
+        session.income = income
+        session.current_field = "state"
+        return "Which state do you live in?", None
+    return "Please provide a valid annual income (numbers only, e.g., 120000).", None
+
+def _handle_state(session: UserSession, user_message: str) -> tuple:
+    if len(user_message) > 2:  # Basic validation
+        session.state = user_message.title()
+        session.current_field = "phone"
+        return "What is your phone number?", None
+    return "Please provide a valid state name.", None
+
+def _handle_phone(session: UserSession, user_message: str) -> tuple:
+    phone = validate_phone(user_message)
+    if phone:
+        session.phone = phone
+        session.current_field = "email"
+        return "What is your email address?", None
+    return "Please provide a valid phone number (10 digits, e.g., 9876543210).", None
+
+def _handle_email(session: UserSession, user_message: str) -> tuple:
+    email = validate_email(user_message)
+    if email:
+        session.email = email
+        session.current_field = "complete"
+
+        # All data collected - evaluate, save and email in the background
+        return "Thank you! We're evaluating your eligibility now. You will receive a detailed email with your eligibility results shortly.", finalize_session
+    return "Please provide a valid email address (e.g., user@example.com).", None
+
+def _handle_complete(session: UserSession, user_message: str) -> tuple:
+    # Handle follow-up questions
+    lowered = user_message.lower()
+    if "tell me more" in lowered or "more about" in lowered:
+        return "I can provide more details about specific schemes. Please mention which scheme you'd like to know more about.", None
+    return "I've already assessed your eligibility. Check your email for detailed results, or start over with different information?", None
+
+# O(1) dispatch on the field being collected instead of an if/elif cascade
+_HANDLERS = {
+    "name": _handle_name,
+    "age": _handle_age,
+    "income": _handle_income,
+    "state": _handle_state,
+    "phone": _handle_phone,
+    "email": _handle_email,
+    "complete": _handle_complete,
+}
+
+def process_message(session: UserSession, user_message: str) -> tuple:
+    """Process user message and return (response, finalize_fn_or_None)
+
+    finalize_fn is set when the session just completed and the slow
+    eligibility/save/email work should run after the response is sent.
+    Dispatches to the handler for the field currently being collected;
+    lowercase lazily only where comparisons need it.
+    """
+    handler = _HANDLERS.get(session.current_field, _handle_complete)
+    return handler(session, user_message.strip())
 
 @app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, background_tasks: BackgroundTasks):
     try:
-        session = get_session(request.session_id)
-        response = process_message(session, request.message)
+        session = await get_session(request.session_id)
+        response, finalize_fn = process_message(session, request.message)
+        await save_session(session)
+        if finalize_fn:
+            background_tasks.add_task(finalize_fn, session)
         return ChatResponse(reply=response)
 
     except Exception as e:
-        print(f"Error processing chat: {e}")
+        logger.error(f"Error processing chat: {e}")
         return ChatResponse(reply="Sorry, I encountered an error. Please try again.")
 
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await smtp_pool.close()
+    await supabase_client.aclose()
+    if redis_client is not None:
+        await redis_client.aclose()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8003)
\ No newline at end of file